@@ -8,6 +8,8 @@ set -euo pipefail
 
 # Configuration
 SCRIPT_NAME=$(basename "$0")
+SCRIPT_DIR="$(cd "$(dirname "${BASH_SOURCE[0]}")" && pwd)"
+SRC_DIR="$(dirname "$SCRIPT_DIR")/src"
 FTP_USER="pftp"
 FTP_PASS="pftp123"
 FTP_ROOT="/var/pits/ftp"
@@ -229,6 +231,16 @@ test_ftp() {
     echo -e "\n${YELLOW}Note: Test from another device using this machine's IP address${NC}"
 }
 
+# Record completed uploads in the space index and enforce the disk budget
+ingest_uploads() {
+    if [[ ! -f "$SRC_DIR/retain.py" ]]; then
+        error "retain.py not found: $SRC_DIR/retain.py"
+        return 1
+    fi
+    # Takes an ingest slot from the work scheduler and is traced when PQTR_TRACE is set
+    python3 "$SRC_DIR/work.py" run ingest -- python3 "$SRC_DIR/retain.py" ingest
+}
+
 # Show usage
 show_usage() {
     cat << EOF
@@ -240,6 +252,7 @@ Commands:
     status      Show current FTP status
     restart     Restart FTP server
     test        Test FTP connection
+    ingest      Index new uploads and free space if the card is full
     help        Show this help message
 
 Examples:
@@ -302,6 +315,9 @@ main() {
         test)
             test_ftp
             ;;
+        ingest)
+            ingest_uploads
+            ;;
         help|--help|-h)
             show_usage
             ;;
@@ -11,6 +11,7 @@ SCRIPT_NAME=$(basename "$0")
 SCRIPT_DIR="$(cd "$(dirname "${BASH_SOURCE[0]}")" && pwd)"
 PROJECT_ROOT="$(dirname "$SCRIPT_DIR")"
 CONFIG_FILE="$PROJECT_ROOT/etc/pits.conf"
+WORK_UNIT="/etc/systemd/system/pits-work.service"
 
 # Colors for output
 RED='\033[0;31m'
@@ -181,6 +182,32 @@ start_http_server() {
     fi
 }
 
+# Start the background work scheduler
+start_work_scheduler() {
+    info "Starting work scheduler"
+    
+    cat > "$WORK_UNIT" << EOF
+[Unit]
+Description=PITS background work scheduler
+After=network.target
+
+[Service]
+ExecStart=/usr/bin/python3 $PROJECT_ROOT/src/work.py serve
+Restart=on-failure
+
+[Install]
+WantedBy=multi-user.target
+EOF
+    
+    systemctl daemon-reload
+    systemctl restart pits-work
+    if systemctl is-active --quiet pits-work; then
+        log "Work scheduler started successfully"
+    else
+        warn "Work scheduler failed to start; stages will run without throttling"
+    fi
+}
+
 # Stop access point
 stop_access_point() {
     info "Stopping access point"
@@ -220,6 +247,13 @@ stop_http_server() {
     fi
 }
 
+# Stop the background work scheduler
+stop_work_scheduler() {
+    info "Stopping work scheduler"
+    systemctl stop pits-work 2>/dev/null || true
+    log "Work scheduler stopped"
+}
+
 # Start all services
 start_all() {
     local hostname="${1:-}"
@@ -241,6 +275,7 @@ start_all() {
         if start_ftp_server; then
             # Start HTTP server
             if start_http_server; then
+                start_work_scheduler
                 log "All PITS services started successfully"
                 show_status
             else
@@ -265,6 +300,7 @@ stop_all() {
     check_root
     log "Stopping all PITS services"
     
+    stop_work_scheduler
     stop_http_server
     stop_ftp_server
     stop_access_point
@@ -300,6 +336,9 @@ show_status() {
         echo "http.sh script not found"
     fi
     
+    echo -e "\n${BLUE}=== Work Scheduler Status ===${NC}"
+    echo -e "pits-work: $(systemctl is-active pits-work 2>/dev/null || echo 'inactive')"
+    
     echo -e "\n${BLUE}=== System Information ===${NC}"
     echo -e "Hostname: $(hostname)"
     echo -e "Uptime: $(uptime -p 2>/dev/null || echo 'unknown')"
@@ -334,6 +373,16 @@ test_services() {
     fi
 }
 
+# Ingest new camera uploads
+ingest_uploads() {
+    if [[ -f "$SCRIPT_DIR/pftp.sh" ]]; then
+        "$SCRIPT_DIR/pftp.sh" ingest
+    else
+        error "pftp.sh script not found: $SCRIPT_DIR/pftp.sh"
+        return 1
+    fi
+}
+
 # Show configuration
 show_config() {
     echo -e "\n${CYAN}=== PITS Configuration ===${NC}"
@@ -417,11 +466,12 @@ show_usage() {
 Usage: $SCRIPT_NAME <command> [options]
 
 Commands:
-    start <hostname>    Start all PITS services (AP + FTP + HTTP)
+    start <hostname>    Start all PITS services (AP + FTP + HTTP + work scheduler)
     stop               Stop all PITS services
     restart <hostname> Restart all PITS services
     status             Show status of all services
     test               Test all services
+    ingest             Index new uploads and enforce the disk budget
     config             Show current configuration
     validate           Validate configuration
     help               Show this help message
@@ -488,6 +538,9 @@ main() {
         test)
             test_services
             ;;
+        ingest)
+            ingest_uploads
+            ;;
         config)
             show_config
             ;;
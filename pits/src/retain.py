@@ -0,0 +1,442 @@
+#!/usr/bin/env python3
+"""
+PITS Retention - Disk budget aware retention and tiering
+Keeps an incrementally updated space index of everything PITS stores on the
+SD card and evicts the cheapest-to-lose files when free space runs low.
+
+Eviction order:
+    1. synced originals (already uploaded), oldest first
+    2. previews, oldest first
+Raw originals are never evicted - they exist nowhere else yet.
+
+Every decision is O(1): the index is updated as files are ingested, previewed
+and synced, and eviction pops from the front of per-tier FIFO queues. No
+directory is ever walked, so ingest does not stall on a full card.
+
+The index is stored as an append-only journal. Pipeline stages record
+changes with one appended line each and never rewrite the file:
+
+    retain.py add <path> <project> <state> [size]   # new original or preview
+    retain.py synced <path>                         # original uploaded
+    retain.py remove <path>                         # file deleted elsewhere
+    retain.py ingest                                # new FTP uploads + enforce
+    retain.py enforce [incoming]                    # make room for incoming bytes
+
+`ingest` reads completed camera uploads from the vsftpd xferlog starting at
+the offset left by the previous run (pftp.sh ingest calls it).
+"""
+
+import os
+import sys
+import json
+import shutil
+import fcntl
+import tomllib
+from pathlib import Path
+from collections import OrderedDict
+from contextlib import contextmanager
+
+from span import tracer
+
+RAW = "raw"
+PREVIEWED = "previewed"
+SYNCED = "synced"
+STATES = (RAW, PREVIEWED, SYNCED)
+
+SIZE_UNITS = {"": 1, "K": 1024, "M": 1024**2, "G": 1024**3, "T": 1024**4}
+
+DEFAULT_CONFIG = Path(__file__).parent.parent / "etc" / "pits.conf"
+
+# Journal growth allowed past twice its last compacted size before rewriting
+COMPACT_SLACK = 64 * 1024
+
+
+def parse_size(value):
+    """Parse a size such as '512M' or '2G' (as used in pits.conf) into bytes."""
+    if isinstance(value, int):
+        return value
+    text = str(value).strip().upper().rstrip("B")
+    unit = text[-1:] if text[-1:] in SIZE_UNITS else ""
+    number = text[: len(text) - len(unit)]
+    try:
+        return int(float(number) * SIZE_UNITS[unit])
+    except ValueError:
+        raise ValueError(f"Invalid size: {value!r}") from None
+
+
+class SpaceIndex:
+    """Incremental index of stored bytes per project and per state.
+
+    Each tracked file has exactly one state. Raw and synced entries are
+    originals; previewed entries are derived preview files. Totals are kept
+    as running sums so queries never touch the filesystem.
+    """
+
+    def __init__(self):
+        self.entries = {}
+        self.totals = {}
+        self.queues = {SYNCED: OrderedDict(), PREVIEWED: OrderedDict()}
+        self.replayed = 0
+
+    def add(self, path, project, state, size):
+        """Track a new file (or replace an existing entry for the same path)."""
+        if state not in STATES:
+            raise ValueError(f"Unknown state: {state}")
+        path = str(path)
+        if path in self.entries:
+            self.remove(path)
+        self.entries[path] = (project, state, int(size))
+        self._count(project, state, int(size))
+        if state in self.queues:
+            self.queues[state][path] = None
+
+    def mark_synced(self, path):
+        """Move a raw original to the synced tier once it has been uploaded."""
+        path = str(path)
+        project, state, size = self.entries[path]
+        if state == SYNCED:
+            return
+        if state != RAW:
+            raise ValueError(f"Only raw originals can be synced: {path}")
+        self._count(project, RAW, -size)
+        self.entries[path] = (project, SYNCED, size)
+        self._count(project, SYNCED, size)
+        self.queues[SYNCED][path] = None
+
+    def remove(self, path):
+        """Stop tracking a file. Returns its size, or 0 if it was unknown."""
+        path = str(path)
+        entry = self.entries.pop(path, None)
+        if entry is None:
+            return 0
+        project, state, size = entry
+        self._count(project, state, -size)
+        if state in self.queues:
+            self.queues[state].pop(path, None)
+        return size
+
+    def oldest(self, state):
+        """Return the oldest evictable path in a tier, or None."""
+        queue = self.queues[state]
+        return next(iter(queue), None)
+
+    def used(self, project=None, state=None):
+        """Return tracked bytes, optionally filtered by project and/or state."""
+        if project is not None:
+            counts = self.totals.get(project, {})
+            if state is not None:
+                return counts.get(state, 0)
+            return sum(counts.values())
+        return sum(self.used(name, state) for name in self.totals)
+
+    def _count(self, project, state, delta):
+        counts = self.totals.setdefault(project, dict.fromkeys(STATES, 0))
+        counts[state] += delta
+
+    def apply(self, record):
+        """Apply one journal record: add, synced or remove."""
+        action, path, *rest = record
+        if action == "add":
+            self.add(path, *rest)
+        elif action == "synced":
+            if self.entries.get(path, (None, None))[1] == RAW:
+                self.mark_synced(path)
+        elif action == "remove":
+            self.remove(path)
+
+    def records(self):
+        """Return add records that rebuild this index with eviction order intact."""
+        raw = [path for path, entry in self.entries.items() if entry[1] == RAW]
+        paths = raw + list(self.queues[PREVIEWED]) + list(self.queues[SYNCED])
+        return [["add", path, *self.entries[path]] for path in paths]
+
+    def save(self, index_file):
+        """Rewrite the journal as a compact snapshot. Caller holds locked()."""
+        index_file = Path(index_file)
+        index_file.parent.mkdir(parents=True, exist_ok=True)
+        tmp_file = index_file.with_suffix(index_file.suffix + ".tmp")
+        with open(tmp_file, "w") as f:
+            for record in self.records():
+                f.write(json.dumps(record) + "\n")
+        os.replace(tmp_file, index_file)
+        Path(f"{index_file}.compacted").write_text(f"{index_file.stat().st_size}\n")
+
+    @classmethod
+    def load(cls, index_file):
+        """Replay a journal. A missing file gives an empty index.
+
+        Lines that do not parse (for example a write cut short by power loss)
+        are skipped.
+        """
+        index = cls()
+        try:
+            f = open(index_file)
+        except FileNotFoundError:
+            return index
+        with f:
+            for line in f:
+                index.replayed += 1
+                try:
+                    index.apply(json.loads(line))
+                except (ValueError, TypeError):
+                    continue
+        return index
+
+
+@contextmanager
+def locked(index_file):
+    """Hold an exclusive lock on the index journal."""
+    lock_file = Path(f"{index_file}.lock")
+    lock_file.parent.mkdir(parents=True, exist_ok=True)
+    with open(lock_file, "a") as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        yield
+
+
+def append(index_file, records):
+    """Append records to the index journal. Caller holds locked()."""
+    with open(index_file, "a") as f:
+        for record in records:
+            f.write(json.dumps(record) + "\n")
+
+
+def journal(index_file, *records):
+    """Append records to the index journal without reading it."""
+    with locked(index_file):
+        append(index_file, records)
+
+
+def bloated(index_file):
+    """Return True when the journal has grown well past its last compaction."""
+    try:
+        size = os.stat(index_file).st_size
+    except FileNotFoundError:
+        return False
+    try:
+        compacted = int(Path(f"{index_file}.compacted").read_text())
+    except (OSError, ValueError):
+        compacted = 0
+    return size > 2 * compacted + COMPACT_SLACK
+
+
+def parse_xferlog(line, ftp_root):
+    """Return (path, project, size) for a completed upload line, else None.
+
+    Standard xferlog lines end in nine fixed fields after the filename, so
+    filenames containing spaces are kept intact.
+    """
+    fields = line.split()
+    if len(fields) < 18 or fields[-7] != "i" or fields[-1] != "c":
+        return None
+    try:
+        size = int(fields[7])
+    except ValueError:
+        return None
+    name = " ".join(fields[8:-9])
+    root = ftp_root.rstrip("/")
+    path = name if name.startswith(root + "/") else root + "/" + name.lstrip("/")
+    parts = path[len(root) + 1:].split("/")
+    project = parts[0] if len(parts) > 1 else "default"
+    return path, project, size
+
+
+def receive(index_file, xferlog, ftp_root):
+    """Journal uploads completed since the last call. Returns the new records.
+
+    The read offset and log inode are kept next to the journal, so each run
+    only reads new log lines and starts over after the log is rotated. The
+    journal lock is held from reading the offset to saving it, so overlapping
+    runs cannot journal the same upload twice.
+    """
+    with locked(index_file):
+        return _receive(index_file, xferlog, ftp_root)
+
+
+def _receive(index_file, xferlog, ftp_root):
+    offset_file = Path(f"{index_file}.xferlog")
+    try:
+        inode, offset = map(int, offset_file.read_text().split())
+    except (OSError, ValueError):
+        inode, offset = 0, 0
+    try:
+        stat = os.stat(xferlog)
+    except FileNotFoundError:
+        return []
+    if stat.st_ino != inode or stat.st_size < offset:
+        offset = 0
+
+    records = []
+    with tracer.span("retain.receive", cat="pits") as span, open(xferlog, "rb") as f:
+        f.seek(offset)
+        for line in f:
+            if not line.endswith(b"\n"):
+                break
+            offset += len(line)
+            upload = parse_xferlog(line.decode(errors="replace"), ftp_root)
+            if upload:
+                path, project, size = upload
+                records.append(["add", path, project, RAW, size])
+                span.add_bytes(size)
+        span.set(received=len(records))
+
+    if records:
+        append(index_file, records)
+    offset_file.write_text(f"{stat.st_ino} {offset}\n")
+    return records
+
+
+class RetentionEngine:
+    """Evicts files from a SpaceIndex when free space crosses a watermark.
+
+    When free space drops below low_water the engine evicts until free space
+    is back above high_water, or nothing evictable is left.
+    """
+
+    def __init__(self, index, root, low_water, high_water,
+                 disk_usage=shutil.disk_usage, unlink=os.unlink):
+        if high_water < low_water:
+            raise ValueError("high_water must be at least low_water")
+        self.index = index
+        self.root = str(root)
+        self.low_water = low_water
+        self.high_water = high_water
+        self.disk_usage = disk_usage
+        self.unlink = unlink
+        self.failed = []
+
+    def free_bytes(self):
+        """Return free bytes on the storage volume (a single statvfs call)."""
+        return self.disk_usage(self.root).free
+
+    def next_victim(self):
+        """Return the next path to evict, or None if nothing is evictable."""
+        return self.index.oldest(SYNCED) or self.index.oldest(PREVIEWED)
+
+    def enforce(self, incoming=0):
+        """Make room for `incoming` bytes. Returns the list of evicted paths.
+
+        A file that cannot be deleted (read-only or failing card) is dropped
+        from the index and listed in `failed`, so it cannot block eviction.
+        A file that is already gone is dropped without counting its size as
+        freed, since statvfs has already seen that space.
+        """
+        free = self.free_bytes() - incoming
+        if free >= self.low_water:
+            return []
+
+        evicted = []
+        with tracer.span("retain.enforce", cat="pits") as span:
+            while free < self.high_water:
+                path = self.next_victim()
+                if path is None:
+                    break
+                try:
+                    self.unlink(path)
+                except FileNotFoundError:
+                    self.index.remove(path)
+                    continue
+                except OSError as exc:
+                    self.index.remove(path)
+                    self.failed.append((path, exc))
+                    continue
+                freed = self.index.remove(path)
+                span.add_bytes(freed)
+                free += freed
+                evicted.append(path)
+            span.set(evicted=len(evicted))
+        return evicted
+
+
+def load_config(config_file=DEFAULT_CONFIG):
+    """Read the [storage] and [retention] sections from pits.conf."""
+    with open(config_file, "rb") as f:
+        config = tomllib.load(f)
+    storage = config.get("storage", {})
+    retention = config.get("retention", {})
+    instance_dir = storage.get("instance_dir", "/var/pits")
+    return {
+        "instance_dir": instance_dir,
+        "index_file": retention.get("index_file", f"{instance_dir}/space-index.jsonl"),
+        "xferlog": retention.get("xferlog", "/var/log/vsftpd/xferlog"),
+        "ftp_root": config.get("ftp", {}).get("ftp_root", f"{instance_dir}/ftp"),
+        "low_water": parse_size(retention.get("low_water", "512M")),
+        "high_water": parse_size(retention.get("high_water", "1G")),
+    }
+
+
+def enforce(config, incoming=0):
+    """Evict as needed. Returns (evicted, failed).
+
+    Free space is checked first, so the journal is only replayed when the
+    card is below low_water or the journal needs compacting.
+    """
+    index_file = config["index_file"]
+    free = shutil.disk_usage(config["instance_dir"]).free - incoming
+    if free >= config["low_water"] and not bloated(index_file):
+        return [], []
+
+    with locked(index_file):
+        index = SpaceIndex.load(index_file)
+        engine = RetentionEngine(index, config["instance_dir"],
+                                 config["low_water"], config["high_water"])
+        evicted = engine.enforce(incoming)
+        if evicted or engine.failed or index.replayed > 2 * len(index.entries):
+            index.save(index_file)
+    return evicted, engine.failed
+
+
+def report(evicted, failed):
+    """Print eviction results. Silent when nothing happened (cron friendly)."""
+    for path in evicted:
+        print(f"Evicted: {path}")
+    for path, exc in failed:
+        print(f"Failed to evict: {path} ({exc})", file=sys.stderr)
+    if evicted:
+        print(f"Evicted {len(evicted)} files")
+
+
+def main():
+    """Main entry point."""
+    args = sys.argv[1:] or ["status"]
+    command, args = args[0], args[1:]
+    config = load_config()
+    index_file = config["index_file"]
+
+    if command == "status":
+        index = SpaceIndex.load(index_file)
+        engine = RetentionEngine(index, config["instance_dir"],
+                                 config["low_water"], config["high_water"])
+        print(f"Free: {engine.free_bytes() / 1024**2:.1f} MB "
+              f"(low {config['low_water'] / 1024**2:.0f} MB, "
+              f"high {config['high_water'] / 1024**2:.0f} MB)")
+        for project in sorted(index.totals):
+            counts = ", ".join(f"{state} {index.used(project, state) / 1024**2:.1f} MB"
+                               for state in STATES)
+            print(f"  {project}: {counts}")
+    elif command == "add" and len(args) in (3, 4):
+        path, project, state = os.path.abspath(args[0]), args[1], args[2]
+        if state not in STATES:
+            print(f"Unknown state: {state} (expected one of {', '.join(STATES)})")
+            sys.exit(1)
+        size = parse_size(args[3]) if len(args) == 4 else os.stat(path).st_size
+        journal(index_file, ["add", path, project, state, size])
+    elif command == "synced" and len(args) == 1:
+        journal(index_file, ["synced", os.path.abspath(args[0])])
+    elif command == "remove" and len(args) == 1:
+        journal(index_file, ["remove", os.path.abspath(args[0])])
+    elif command == "ingest" and not args:
+        records = receive(index_file, config["xferlog"], config["ftp_root"])
+        if records:
+            print(f"Received {len(records)} files")
+        report(*enforce(config))
+    elif command == "enforce" and len(args) <= 1:
+        report(*enforce(config, parse_size(args[0]) if args else 0))
+    else:
+        print(f"Unknown command: {' '.join([command, *args])}")
+        print("Available commands: status, add <path> <project> <state> [size], "
+              "synced <path>, remove <path>, ingest, enforce [incoming]")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
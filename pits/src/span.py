@@ -0,0 +1,241 @@
+#!/usr/bin/env python3
+"""
+Span - Lightweight tracing and profiling hooks
+Records spans with wall time, CPU time, bytes processed and memory, and
+exports them as Chrome trace-event JSON (open in chrome://tracing or
+https://ui.perfetto.dev for a flamegraph style view).
+
+This is the only copy: site/src/main.py imports it from here and site
+builds copy it into the build.
+
+Tracing is off unless PQTR_TRACE names an output file. When off, span()
+returns a shared no-op object and traced() calls straight through.
+
+    PQTR_TRACE=/tmp/trace.json python3 src/main.py build
+
+Memory per in-process span is the resident set size at entry and exit
+(rss_start_kb, rss_end_kb) plus process_peak_rss_kb, the high-water mark of
+the whole process so far. Commands traced with run() report peak_rss_kb,
+the peak of that command alone.
+
+Shell stages can be traced by running them through this module; each run
+appends to the same trace file (work.py run does the same for scheduled stages):
+
+    PQTR_TRACE=/tmp/trace.json python3 src/span.py run pits.ingest -- python3 src/retain.py ingest
+"""
+
+import os
+import sys
+import json
+import time
+import fcntl
+import atexit
+import resource
+import functools
+import threading
+import subprocess
+
+TRACE_ENV = "PQTR_TRACE"
+PAGE_KB = resource.getpagesize() // 1024
+
+
+class NullSpan:
+    """Span used when tracing is disabled. Every operation is a no-op."""
+
+    active = False
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def add_bytes(self, count):
+        pass
+
+    def set(self, **args):
+        pass
+
+
+NULL_SPAN = NullSpan()
+
+
+class Span:
+    """A timed region of work. Use as a context manager."""
+
+    active = True
+
+    def __init__(self, tracer, name, cat, args):
+        self.tracer = tracer
+        self.name = name
+        self.cat = cat
+        self.args = dict(args)
+        self.bytes = 0
+
+    def __enter__(self):
+        self.rss = current_rss_kb()
+        self.wall = time.perf_counter()
+        self.cpu = time.thread_time()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        end = time.perf_counter()
+        cpu = time.thread_time() - self.cpu
+        if exc_type is not None:
+            self.args["error"] = exc_type.__name__
+        usage = resource.getrusage(resource.RUSAGE_SELF)
+        self.args.update(rss_start_kb=self.rss, rss_end_kb=current_rss_kb(),
+                         process_peak_rss_kb=maxrss_kb(usage))
+        self.tracer.record(self.name, self.cat, self.wall, end, cpu, self.bytes, self.args)
+        return False
+
+    def add_bytes(self, count):
+        """Add to the number of bytes processed in this span."""
+        self.bytes += count
+
+    def set(self, **args):
+        """Attach extra key/value arguments to the span."""
+        self.args.update(args)
+
+
+def maxrss_kb(usage):
+    """Return ru_maxrss from a rusage in kilobytes (macOS reports bytes)."""
+    return usage.ru_maxrss // 1024 if sys.platform == "darwin" else usage.ru_maxrss
+
+
+def current_rss_kb():
+    """Return the current resident set size in kilobytes, or None off Linux."""
+    try:
+        with open("/proc/self/statm") as f:
+            pages = int(f.read().split()[1])
+    except (OSError, IndexError, ValueError):
+        return None
+    return pages * PAGE_KB
+
+
+class Tracer:
+    """Collects spans and writes them out as Chrome trace events."""
+
+    def __init__(self, path=None):
+        self.path = path
+        self.enabled = bool(path)
+        self.events = []
+        self.lock = threading.Lock()
+        self.epoch = time.perf_counter() - time.time()
+
+    def enable(self, path=None):
+        """Start recording spans, optionally setting the export path."""
+        self.path = path or self.path
+        self.enabled = True
+
+    def disable(self):
+        """Stop recording spans. Recorded events are kept."""
+        self.enabled = False
+
+    def span(self, name, cat="pqtr", **args):
+        """Return a context manager timing the enclosed block."""
+        if not self.enabled:
+            return NULL_SPAN
+        return Span(self, name, cat, args)
+
+    def traced(self, name=None, cat="pqtr"):
+        """Decorator that wraps every call of a function in a span."""
+        def decorate(fn):
+            span_name = name or fn.__qualname__
+
+            @functools.wraps(fn)
+            def wrapper(*args, **kwargs):
+                if not self.enabled:
+                    return fn(*args, **kwargs)
+                with Span(self, span_name, cat, {}):
+                    return fn(*args, **kwargs)
+            return wrapper
+        return decorate
+
+    def record(self, name, cat, start, end, cpu, nbytes, args):
+        """Store one completed span. Times are perf_counter seconds."""
+        event = {
+            "name": name,
+            "cat": cat,
+            "ph": "X",
+            "ts": round((start - self.epoch) * 1e6),
+            "dur": round((end - start) * 1e6),
+            "pid": os.getpid(),
+            "tid": threading.get_ident(),
+            "args": {
+                "cpu_ms": round(cpu * 1e3, 3),
+                "bytes": nbytes,
+                **args,
+            },
+        }
+        with self.lock:
+            self.events.append(event)
+
+    def run(self, name, argv, cat="pqtr"):
+        """Run a command as a traced stage. Returns its exit code.
+
+        CPU time and peak RSS come from wait4() for this child alone, so
+        shell stages get the same numbers as in-process spans.
+        """
+        start = time.perf_counter()
+        proc = subprocess.Popen(argv)
+        _, status, usage = os.wait4(proc.pid, 0)
+        end = time.perf_counter()
+        proc.returncode = os.waitstatus_to_exitcode(status)
+        if self.enabled:
+            self.record(name, cat, start, end, usage.ru_utime + usage.ru_stime, 0,
+                        {"argv": " ".join(argv), "returncode": proc.returncode,
+                         "peak_rss_kb": maxrss_kb(usage)})
+        return proc.returncode
+
+    def export(self, path=None):
+        """Write recorded events as Chrome trace JSON.
+
+        Events already in the file are kept, so several processes (for
+        example a chain of shell stages) can add to one trace. The file is
+        locked while it is rewritten so concurrent exports do not lose events.
+        """
+        path = path or self.path
+        if not path:
+            return None
+        with self.lock:
+            events = list(self.events)
+            self.events.clear()
+        if not events:
+            return path
+        with open(f"{path}.lock", "a") as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            existing = []
+            try:
+                with open(path) as f:
+                    existing = json.load(f).get("traceEvents", [])
+            except (OSError, ValueError):
+                pass
+            with open(path, "w") as f:
+                json.dump({"traceEvents": existing + events, "displayTimeUnit": "ms"}, f)
+        return path
+
+
+tracer = Tracer(os.environ.get(TRACE_ENV))
+span = tracer.span
+traced = tracer.traced
+
+atexit.register(tracer.export)
+
+
+def main():
+    """Main entry point."""
+    args = sys.argv[1:]
+    if len(args) >= 2 and args[0] == "run":
+        name, argv = args[1], args[2:]
+        if argv and argv[0] == "--":
+            argv = argv[1:]
+        if argv:
+            sys.exit(tracer.run(name, argv))
+    print("Usage: span.py run <name> -- <command> [args...]")
+    print(f"Set {TRACE_ENV}=<file> to record a Chrome trace")
+    sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
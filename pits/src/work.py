@@ -0,0 +1,496 @@
+#!/usr/bin/env python3
+"""
+PITS Work - Thermal and load aware work scheduler
+Runs PITS pipeline stages on a shared worker pool whose per-class limits
+adapt to system pressure, so that camera FTP receive (vsftpd, outside the
+pool) is never starved on fanless field hardware.
+
+Job classes in priority order:
+    ingest   - indexing new camera uploads, never throttled
+    preview  - preview generation
+    hash     - checksum calculation
+    upload   - upload to the PQTR service
+
+Background classes also run at lower CPU and IO priority (nice/ionice), so
+vsftpd wins whenever it needs the CPU or the card.
+
+Pressure is read from /proc/loadavg, the PSI files in /proc/pressure and the
+sysfs thermal zone. The root directory is configurable so tests can point the
+probe at a fake tree.
+
+Shell stages go through the scheduler daemon (started by pits.sh start):
+
+    work.py serve                          # run the scheduler daemon
+    work.py run <class> -- <cmd> [args]    # wait for a slot, then run cmd
+    work.py status | metrics               # read the daemon's metrics file
+
+If the daemon is not running, `run` still runs the command at the class's
+priority, just without waiting for a slot.
+"""
+
+import os
+import sys
+import time
+import shutil
+import signal
+import socket
+import tomllib
+import threading
+import socketserver
+from pathlib import Path
+from collections import deque
+from concurrent.futures import Future
+
+from span import tracer
+
+INGEST = "ingest"
+PREVIEW = "preview"
+HASH = "hash"
+UPLOAD = "upload"
+
+# Job classes in priority order with their maximum worker counts
+DEFAULT_CLASSES = {INGEST: 1, PREVIEW: 2, HASH: 1, UPLOAD: 1}
+
+# CPU nice level per class; classes above 0 also get the lowest best-effort IO priority
+DEFAULT_NICE = {INGEST: 0, PREVIEW: 10, HASH: 15, UPLOAD: 19}
+
+# (soft, hard) limits per reading; pressure rises linearly between them
+DEFAULT_THRESHOLDS = {
+    "temp": (65.0, 80.0),
+    "load": (0.7, 1.5),
+    "cpu": (10.0, 40.0),
+    "io": (10.0, 40.0),
+    "memory": (5.0, 20.0),
+}
+
+DEFAULT_CONFIG = Path(__file__).parent.parent / "etc" / "pits.conf"
+
+
+class SystemProbe:
+    """Reads load, PSI pressure and temperature from procfs and sysfs."""
+
+    def __init__(self, root="/", thermal_zone="thermal_zone0"):
+        self.root = Path(root)
+        self.thermal_zone = thermal_zone
+
+    def _read(self, *parts):
+        try:
+            return (self.root.joinpath(*parts)).read_text()
+        except OSError:
+            return None
+
+    def load(self):
+        """Return the 1 minute load average divided by the CPU count."""
+        text = self._read("proc", "loadavg")
+        try:
+            return float(text.split()[0]) / (os.cpu_count() or 1)
+        except (AttributeError, IndexError, ValueError):
+            return None
+
+    def pressure(self, resource):
+        """Return the PSI 'some avg10' percentage for cpu, io or memory."""
+        text = self._read("proc", "pressure", resource)
+        if text is None:
+            return None
+        for line in text.splitlines():
+            if line.startswith("some "):
+                fields = dict(item.partition("=")[::2] for item in line.split()[1:])
+                try:
+                    return float(fields["avg10"])
+                except (KeyError, ValueError):
+                    return None
+        return None
+
+    def temperature(self):
+        """Return the thermal zone temperature in degrees Celsius."""
+        text = self._read("sys", "class", "thermal", self.thermal_zone, "temp")
+        try:
+            return int(text.strip()) / 1000.0
+        except (AttributeError, ValueError):
+            return None
+
+    def read(self):
+        """Return all readings. Unavailable readings are None."""
+        return {
+            "temp": self.temperature(),
+            "load": self.load(),
+            "cpu": self.pressure("cpu"),
+            "io": self.pressure("io"),
+            "memory": self.pressure("memory"),
+        }
+
+
+def pressure_level(readings, thresholds=DEFAULT_THRESHOLDS):
+    """Combine readings into a single pressure level between 0.0 and 1.0."""
+    level = 0.0
+    for name, value in readings.items():
+        if value is None or name not in thresholds:
+            continue
+        soft, hard = thresholds[name]
+        level = max(level, min(1.0, max(0.0, (value - soft) / (hard - soft))))
+    return level
+
+
+def plan_limits(level, classes=DEFAULT_CLASSES):
+    """Return worker limits per class for a pressure level.
+
+    Ingest keeps its full allowance. The background budget shrinks with the
+    pressure level and is handed out in priority order: first one worker per
+    class so nothing starves, then the rest up to each class maximum.
+    """
+    names = list(classes)
+    limits = {INGEST: classes[INGEST]}
+    background = names[1:]
+    budget = round(sum(classes[name] for name in background) * (1.0 - level))
+
+    for name in background:
+        limits[name] = 0
+    for name in background:
+        if budget and classes[name]:
+            limits[name] = 1
+            budget -= 1
+    for name in background:
+        extra = min(budget, classes[name] - limits[name])
+        limits[name] += extra
+        budget -= extra
+    return limits
+
+
+class Scheduler:
+    """Priority worker pool with pressure adaptive per-class limits."""
+
+    def __init__(self, probe=None, classes=DEFAULT_CLASSES,
+                 thresholds=DEFAULT_THRESHOLDS, interval=5.0, metrics_file=None):
+        for name, (soft, hard) in thresholds.items():
+            if soft >= hard:
+                raise ValueError(f"{name}_soft must be below {name}_hard")
+        self.probe = probe or SystemProbe()
+        self.classes = dict(classes)
+        self.thresholds = dict(thresholds)
+        self.interval = interval
+        self.metrics_file = metrics_file
+
+        self.queues = {name: deque() for name in self.classes}
+        self.running = dict.fromkeys(self.classes, 0)
+        self.limits = dict(self.classes)
+        self.stats = {
+            "decisions": 0,
+            "level": 0.0,
+            "readings": {},
+            "submitted": dict.fromkeys(self.classes, 0),
+            "completed": dict.fromkeys(self.classes, 0),
+            "failed": dict.fromkeys(self.classes, 0),
+            "wait_seconds": dict.fromkeys(self.classes, 0.0),
+        }
+
+        self.lock = threading.Condition()
+        self.stopped = threading.Event()
+        self.threads = []
+        self.stopping = False
+
+    def submit(self, kind, fn, *args, **kwargs):
+        """Queue a job of the given class. Returns a Future for its result."""
+        if kind not in self.queues:
+            raise ValueError(f"Unknown job class: {kind}")
+        future = Future()
+        with self.lock:
+            self.queues[kind].append((future, fn, args, kwargs, time.monotonic()))
+            self.stats["submitted"][kind] += 1
+            self.lock.notify()
+        return future
+
+    def adapt(self):
+        """Re-read system pressure and recompute per-class limits."""
+        readings = self.probe.read()
+        level = pressure_level(readings, self.thresholds)
+        limits = plan_limits(level, self.classes)
+        with self.lock:
+            self.limits = limits
+            self.stats["decisions"] += 1
+            self.stats["level"] = level
+            self.stats["readings"] = readings
+            self.lock.notify_all()
+        return limits
+
+    def _next_job(self):
+        """Pop the highest priority runnable job. Caller holds the lock."""
+        for name, queue in self.queues.items():
+            if queue and self.running[name] < self.limits[name]:
+                self.running[name] += 1
+                return name, queue.popleft()
+        return None
+
+    def _worker(self):
+        while True:
+            with self.lock:
+                picked = self._next_job()
+                while picked is None and not self.stopping:
+                    self.lock.wait()
+                    picked = self._next_job()
+                if picked is None:
+                    return
+                name, (future, fn, args, kwargs, queued) = picked
+                self.stats["wait_seconds"][name] += time.monotonic() - queued
+
+            ok = False
+            if future.set_running_or_notify_cancel():
+                try:
+                    with tracer.span(name, cat="pits", job=getattr(fn, "__name__", "")):
+                        result = fn(*args, **kwargs)
+                    future.set_result(result)
+                    ok = True
+                except BaseException as exc:
+                    future.set_exception(exc)
+
+            with self.lock:
+                self.running[name] -= 1
+                self.stats["completed" if ok else "failed"][name] += 1
+                self.lock.notify_all()
+
+    def _control(self):
+        # Sleeps on its own event so job wakeups on self.lock always reach a worker
+        while not self.stopped.wait(self.interval):
+            try:
+                self.adapt()
+                self.write_metrics()
+            except Exception as exc:
+                print(f"Scheduler pressure check failed: {exc!r}", file=sys.stderr)
+
+    def start(self):
+        """Start worker threads and the pressure control loop."""
+        self.adapt()
+        self.stopping = False
+        self.stopped.clear()
+        workers = sum(self.classes.values())
+        targets = [self._worker] * workers + [self._control]
+        for target in targets:
+            thread = threading.Thread(target=target, daemon=True)
+            thread.start()
+            self.threads.append(thread)
+
+    def stop(self, wait=True):
+        """Stop after draining runnable jobs. Jobs held back by limits are cancelled."""
+        self.stopped.set()
+        with self.lock:
+            self.stopping = True
+            self.lock.notify_all()
+        if wait:
+            for thread in self.threads:
+                thread.join()
+            with self.lock:
+                for queue in self.queues.values():
+                    while queue:
+                        queue.popleft()[0].cancel()
+        self.threads = []
+
+    def metrics(self):
+        """Return a snapshot of scheduler decisions and queue state."""
+        with self.lock:
+            return {
+                "decisions": self.stats["decisions"],
+                "level": self.stats["level"],
+                "readings": dict(self.stats["readings"]),
+                "limits": dict(self.limits),
+                "running": dict(self.running),
+                "queued": {name: len(queue) for name, queue in self.queues.items()},
+                "submitted": dict(self.stats["submitted"]),
+                "completed": dict(self.stats["completed"]),
+                "failed": dict(self.stats["failed"]),
+                "wait_seconds": dict(self.stats["wait_seconds"]),
+            }
+
+    def render_metrics(self):
+        """Return metrics in Prometheus text format (node_exporter textfile)."""
+        snapshot = self.metrics()
+        lines = [
+            f"pits_sched_decisions_total {snapshot['decisions']}",
+            f"pits_sched_pressure_level {snapshot['level']:.3f}",
+        ]
+        for name, value in snapshot["readings"].items():
+            if value is not None:
+                lines.append(f'pits_sched_reading{{source="{name}"}} {value}')
+        for key in ("limits", "running", "queued", "submitted", "completed",
+                    "failed", "wait_seconds"):
+            suffix = "_total" if key in ("submitted", "completed", "failed") else ""
+            for name, value in snapshot[key].items():
+                lines.append(f'pits_sched_{key}{suffix}{{class="{name}"}} {value}')
+        return "\n".join(lines) + "\n"
+
+    def write_metrics(self):
+        """Atomically write render_metrics() to metrics_file, if set."""
+        if not self.metrics_file:
+            return
+        path = Path(self.metrics_file)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_file = path.with_suffix(path.suffix + ".tmp")
+        tmp_file.write_text(self.render_metrics())
+        os.replace(tmp_file, path)
+
+
+class WorkHandler(socketserver.StreamRequestHandler):
+    """Grants one scheduler slot per connection to a `work.py run` client.
+
+    Protocol: the client sends its class, the daemon answers "go" once a
+    worker picks the job up, and the slot is held until the client sends
+    "done <returncode>" or disconnects.
+    """
+
+    def handle(self):
+        kind = self.rfile.readline().decode(errors="replace").strip()
+        try:
+            future = self.server.scheduler.submit(kind, self.hold)
+        except ValueError as exc:
+            self.wfile.write(f"error {exc}\n".encode())
+            return
+        try:
+            future.result()
+        except Exception:
+            pass
+
+    def hold(self):
+        self.wfile.write(b"go\n")
+        reply = self.rfile.readline().split()
+        if reply[:1] != [b"done"] or reply[1:] != [b"0"]:
+            raise RuntimeError(f"stage failed: {b' '.join(reply).decode(errors='replace')}")
+
+
+class WorkServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    """Unix socket front end of a running Scheduler."""
+
+    daemon_threads = True
+
+    def __init__(self, socket_path, scheduler):
+        try:
+            os.unlink(socket_path)
+        except FileNotFoundError:
+            pass
+        Path(socket_path).parent.mkdir(parents=True, exist_ok=True)
+        super().__init__(str(socket_path), WorkHandler)
+        self.scheduler = scheduler
+
+
+def request_slot(socket_path, kind):
+    """Wait for a slot from the daemon. Returns the socket, or None if it is not running."""
+    conn = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        conn.connect(str(socket_path))
+        conn.sendall(f"{kind}\n".encode())
+        reply = conn.makefile("rb").readline()
+    except OSError:
+        conn.close()
+        return None
+    if reply.startswith(b"error"):
+        conn.close()
+        raise ValueError(reply.decode(errors="replace").strip())
+    if reply != b"go\n":
+        conn.close()
+        return None
+    return conn
+
+
+def niced(argv, nice=0):
+    """Prefix a command so it runs at the given CPU and IO priority."""
+    if nice <= 0:
+        return list(argv)
+    prefix = ["nice", "-n", str(nice)]
+    if shutil.which("ionice"):
+        prefix += ["ionice", "-c", "2", "-n", "7"]
+    return prefix + list(argv)
+
+
+def run_stage(config, kind, argv):
+    """Run a shell stage in a scheduler slot of the given class. Returns its exit code."""
+    if kind not in config["classes"]:
+        raise ValueError(f"Unknown job class: {kind}")
+    conn = request_slot(config["socket"], kind)
+    returncode = 1
+    try:
+        returncode = tracer.run(f"work.{kind}", niced(argv, config["nice"][kind]), cat="pits")
+    finally:
+        if conn is not None:
+            try:
+                conn.sendall(f"done {returncode}\n".encode())
+            except OSError:
+                pass
+            conn.close()
+    return returncode
+
+
+def serve(config):
+    """Run the scheduler daemon until SIGTERM or SIGINT."""
+    scheduler = Scheduler(SystemProbe(config["sysfs_root"]), config["classes"],
+                          config["thresholds"], config["interval"], config["metrics_file"])
+    scheduler.start()
+    scheduler.write_metrics()
+    server = WorkServer(config["socket"], scheduler)
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        os.unlink(config["socket"])
+        scheduler.stop(wait=False)
+        scheduler.write_metrics()
+
+
+def load_config(config_file=DEFAULT_CONFIG):
+    """Read the [scheduler] section from pits.conf."""
+    with open(config_file, "rb") as f:
+        section = tomllib.load(f).get("scheduler", {})
+    classes = {name: int(section.get(f"{name}_workers", count))
+               for name, count in DEFAULT_CLASSES.items()}
+    thresholds = {name: (float(section.get(f"{name}_soft", soft)),
+                         float(section.get(f"{name}_hard", hard)))
+                  for name, (soft, hard) in DEFAULT_THRESHOLDS.items()}
+    for name, (soft, hard) in thresholds.items():
+        if soft >= hard:
+            raise ValueError(f"{name}_soft must be below {name}_hard in [scheduler]")
+    nice = {name: int(section.get(f"{name}_nice", level))
+            for name, level in DEFAULT_NICE.items()}
+    return {
+        "classes": classes,
+        "thresholds": thresholds,
+        "nice": nice,
+        "interval": float(section.get("interval", 5)),
+        "sysfs_root": section.get("sysfs_root", "/"),
+        "socket": section.get("socket", "/run/pits/work.sock"),
+        "metrics_file": section.get("metrics_file", "/var/pits/work.prom"),
+    }
+
+
+def main():
+    """Main entry point."""
+    args = sys.argv[1:] or ["status"]
+    command = args[0]
+    config = load_config()
+
+    if command == "serve":
+        serve(config)
+    elif command == "run" and len(args) >= 3:
+        kind, argv = args[1], args[2:]
+        if argv[0] == "--":
+            argv = argv[1:]
+        if not argv:
+            print("Usage: work.py run <class> -- <command> [args...]")
+            sys.exit(1)
+        if kind not in config["classes"]:
+            print(f"Unknown job class: {kind} (available: {', '.join(config['classes'])})")
+            sys.exit(1)
+        sys.exit(run_stage(config, kind, argv))
+    elif command in ("status", "metrics"):
+        try:
+            text = Path(config["metrics_file"]).read_text()
+        except FileNotFoundError:
+            print(f"No metrics at {config['metrics_file']} - is 'work.py serve' running?")
+            sys.exit(1)
+        print(text, end="")
+    else:
+        print(f"Unknown command: {command}")
+        print("Available commands: serve, run <class> -- <command>, status, metrics")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,311 @@
+#!/usr/bin/env python3
+"""
+Retention Tests for PITS Project
+Tests the space index and watermark driven eviction
+"""
+
+import pytest
+import os
+import sys
+import threading
+from pathlib import Path
+from types import SimpleNamespace
+
+# Add src directory to path for imports
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
+
+from retain import (  # noqa: E402
+    SpaceIndex, RetentionEngine, RAW, PREVIEWED, SYNCED, parse_size, load_config,
+    journal, parse_xferlog, receive, locked, enforce, main,
+)
+
+XFERLOG_LINE = (
+    "Mon Oct 19 10:15:02 2026 1 192.168.4.23 {size} {name} b _ i r pftp ftp 0 * {status}\n"
+)
+
+
+class FakeDisk:
+    """Disk whose free space grows as files are unlinked"""
+
+    def __init__(self, index, free):
+        self.index = index
+        self.free = free
+        self.unlinked = []
+
+    def disk_usage(self, root):
+        return SimpleNamespace(free=self.free)
+
+    def unlink(self, path):
+        self.unlinked.append(path)
+        self.free += self.index.entries[path][2]
+
+
+class TestSpaceIndex:
+    """Test the incremental space index"""
+
+    def test_totals_per_project_and_state(self):
+        """Test that bytes are tracked per project and per state"""
+        index = SpaceIndex()
+        index.add("/a/1.jpg", "alpha", RAW, 100)
+        index.add("/a/1.prev.jpg", "alpha", PREVIEWED, 10)
+        index.add("/b/1.jpg", "beta", RAW, 200)
+        assert index.used("alpha", RAW) == 100
+        assert index.used("alpha") == 110
+        assert index.used(state=RAW) == 300
+        assert index.used() == 310
+
+    def test_mark_synced_moves_bytes(self):
+        """Test that syncing moves bytes from raw to synced"""
+        index = SpaceIndex()
+        index.add("/a/1.jpg", "alpha", RAW, 100)
+        index.mark_synced("/a/1.jpg")
+        assert index.used("alpha", RAW) == 0
+        assert index.used("alpha", SYNCED) == 100
+        assert index.oldest(SYNCED) == "/a/1.jpg"
+
+    def test_mark_synced_rejects_previews(self):
+        """Test that previews cannot be marked synced"""
+        index = SpaceIndex()
+        index.add("/a/1.prev.jpg", "alpha", PREVIEWED, 10)
+        with pytest.raises(ValueError):
+            index.mark_synced("/a/1.prev.jpg")
+
+    def test_remove_returns_size(self):
+        """Test that removing an entry updates totals"""
+        index = SpaceIndex()
+        index.add("/a/1.jpg", "alpha", RAW, 100)
+        assert index.remove("/a/1.jpg") == 100
+        assert index.remove("/a/1.jpg") == 0
+        assert index.used() == 0
+
+    def test_save_and_load_keeps_order(self, tmp_path):
+        """Test that the index round trips with eviction order intact"""
+        index = SpaceIndex()
+        index.add("/a/1.jpg", "alpha", RAW, 100)
+        index.add("/a/2.jpg", "alpha", RAW, 100)
+        index.mark_synced("/a/2.jpg")
+        index.mark_synced("/a/1.jpg")
+        index.save(tmp_path / "index.json")
+
+        loaded = SpaceIndex.load(tmp_path / "index.json")
+        assert loaded.used("alpha", SYNCED) == 200
+        assert loaded.oldest(SYNCED) == "/a/2.jpg"
+
+    def test_journal_appends_are_replayed(self, tmp_path):
+        """Test that journal records rebuild the index"""
+        index_file = tmp_path / "index.jsonl"
+        journal(index_file, ["add", "/a/1.jpg", "alpha", RAW, 100])
+        journal(index_file, ["add", "/a/2.jpg", "alpha", RAW, 50],
+                ["synced", "/a/1.jpg"], ["remove", "/a/2.jpg"])
+        index = SpaceIndex.load(index_file)
+        assert index.used("alpha", SYNCED) == 100
+        assert index.used("alpha", RAW) == 0
+
+    def test_load_skips_bad_records(self, tmp_path):
+        """Test that a truncated or invalid line does not break the index"""
+        index_file = tmp_path / "index.jsonl"
+        journal(index_file, ["add", "/a/1.jpg", "alpha", RAW, 100],
+                ["add", "/a/2.jpg", "alpha", "bogus", 5], ["synced", "/a/9.jpg"])
+        with open(index_file, "a") as f:
+            f.write('["add", "/a/3.jp')
+        assert SpaceIndex.load(index_file).used() == 100
+
+    def test_load_missing_file(self, tmp_path):
+        """Test that a missing index file loads as empty"""
+        assert SpaceIndex.load(tmp_path / "missing.json").used() == 0
+
+
+class TestRetentionEngine:
+    """Test watermark driven eviction"""
+
+    def make_engine(self, free, low=100, high=300):
+        index = SpaceIndex()
+        disk = FakeDisk(index, free)
+        engine = RetentionEngine(index, "/var/pits", low, high,
+                                 disk_usage=disk.disk_usage, unlink=disk.unlink)
+        return index, disk, engine
+
+    def test_no_eviction_above_low_water(self):
+        """Test that nothing is evicted while free space is above low water"""
+        index, disk, engine = self.make_engine(free=150)
+        index.add("/a/1.jpg", "alpha", RAW, 100)
+        index.mark_synced("/a/1.jpg")
+        assert engine.enforce() == []
+
+    def test_evicts_synced_before_previews(self):
+        """Test that synced originals go before previews"""
+        index, disk, engine = self.make_engine(free=50)
+        index.add("/a/1.prev.jpg", "alpha", PREVIEWED, 100)
+        index.add("/a/1.jpg", "alpha", RAW, 100)
+        index.mark_synced("/a/1.jpg")
+        index.add("/a/2.jpg", "alpha", RAW, 100)
+        index.mark_synced("/a/2.jpg")
+        assert engine.enforce() == ["/a/1.jpg", "/a/2.jpg", "/a/1.prev.jpg"]
+        assert disk.free == 350
+
+    def test_stops_at_high_water(self):
+        """Test that eviction stops once high water is reached"""
+        index, disk, engine = self.make_engine(free=50)
+        for n in range(5):
+            index.add(f"/a/{n}.jpg", "alpha", RAW, 100)
+            index.mark_synced(f"/a/{n}.jpg")
+        assert engine.enforce() == ["/a/0.jpg", "/a/1.jpg", "/a/2.jpg"]
+        assert index.used("alpha", SYNCED) == 200
+
+    def test_never_evicts_raw(self):
+        """Test that unsynced originals are never evicted"""
+        index, disk, engine = self.make_engine(free=50)
+        index.add("/a/1.jpg", "alpha", RAW, 100)
+        assert engine.enforce() == []
+        assert index.used("alpha", RAW) == 100
+
+    def test_incoming_bytes_trigger_eviction(self):
+        """Test that room is made ahead of an incoming upload"""
+        index, disk, engine = self.make_engine(free=150)
+        index.add("/a/1.jpg", "alpha", RAW, 100)
+        index.mark_synced("/a/1.jpg")
+        assert engine.enforce(incoming=100) == ["/a/1.jpg"]
+
+    def test_unlink_error_does_not_block_eviction(self):
+        """Test that a file that cannot be deleted is skipped, not retried forever"""
+        index, disk, engine = self.make_engine(free=50)
+
+        def unlink(path):
+            if path == "/a/0.jpg":
+                raise PermissionError(30, "Read-only file system", path)
+            disk.unlink(path)
+
+        engine.unlink = unlink
+        for n in range(4):
+            index.add(f"/a/{n}.jpg", "alpha", RAW, 100)
+            index.mark_synced(f"/a/{n}.jpg")
+        assert engine.enforce() == ["/a/1.jpg", "/a/2.jpg", "/a/3.jpg"]
+        assert [path for path, exc in engine.failed] == ["/a/0.jpg"]
+        assert "/a/0.jpg" not in index.entries
+
+    def test_missing_file_is_dropped_from_index(self):
+        """Test that a vanished file is dropped without counting as freed space"""
+        index, disk, engine = self.make_engine(free=50, low=100, high=200)
+
+        def unlink(path):
+            if path == "/gone/a":
+                raise FileNotFoundError(2, "No such file or directory", path)
+            disk.unlink(path)
+
+        engine.unlink = unlink
+        for path in ("/gone/a", "/x/b", "/x/c"):
+            index.add(path, "alpha", RAW, 100)
+            index.mark_synced(path)
+        assert engine.enforce() == ["/x/b", "/x/c"]
+        assert disk.free == 250
+        assert index.used() == 0
+
+
+class TestReceive:
+    """Test indexing camera uploads from the vsftpd xferlog"""
+
+    def test_parse_xferlog(self):
+        """Test that completed uploads are parsed and others ignored"""
+        line = XFERLOG_LINE.format(size=2048, name="/shoot1/IMG 0001.JPG", status="c")
+        assert parse_xferlog(line, "/var/pits/ftp") == \
+            ("/var/pits/ftp/shoot1/IMG 0001.JPG", "shoot1", 2048)
+        line = XFERLOG_LINE.format(size=10, name="/IMG_0002.JPG", status="c")
+        assert parse_xferlog(line, "/var/pits/ftp")[1] == "default"
+        line = XFERLOG_LINE.format(size=10, name="/IMG_0003.JPG", status="i")
+        assert parse_xferlog(line, "/var/pits/ftp") is None
+
+    def test_receive_reads_only_new_lines(self, tmp_path):
+        """Test that each run picks up where the previous one stopped"""
+        index_file = tmp_path / "index.jsonl"
+        xferlog = tmp_path / "xferlog"
+        xferlog.write_text(XFERLOG_LINE.format(size=100, name="/s/1.jpg", status="c"))
+        assert len(receive(index_file, xferlog, "/var/pits/ftp")) == 1
+        assert receive(index_file, xferlog, "/var/pits/ftp") == []
+
+        with open(xferlog, "a") as f:
+            f.write(XFERLOG_LINE.format(size=200, name="/s/2.jpg", status="c"))
+            f.write("Mon Oct 19 10:15:09 2026 1 192.168.4.23 300 /s/3.jpg")
+        assert len(receive(index_file, xferlog, "/var/pits/ftp")) == 1
+        assert SpaceIndex.load(index_file).used("s", RAW) == 300
+
+    def test_receive_waits_for_the_journal_lock(self, tmp_path):
+        """Test that an overlapping run cannot read the offset mid-update"""
+        index_file = tmp_path / "index.jsonl"
+        xferlog = tmp_path / "xferlog"
+        xferlog.write_text(XFERLOG_LINE.format(size=100, name="/s/1.jpg", status="c"))
+        results = []
+        with locked(index_file):
+            worker = threading.Thread(
+                target=lambda: results.append(receive(index_file, xferlog, "/var/pits/ftp")))
+            worker.start()
+            worker.join(0.2)
+            assert worker.is_alive()
+        worker.join(5)
+        assert len(results[0]) == 1
+
+
+class TestEnforceCommand:
+    """Test the cron facing enforce path"""
+
+    def make_config(self, tmp_path, low_water):
+        return {
+            "instance_dir": str(tmp_path),
+            "index_file": str(tmp_path / "index.jsonl"),
+            "xferlog": str(tmp_path / "xferlog"),
+            "ftp_root": "/var/pits/ftp",
+            "low_water": low_water,
+            "high_water": low_water,
+        }
+
+    def test_plenty_of_space_skips_replay(self, tmp_path, monkeypatch):
+        """Test that the journal is not read while the card has room"""
+        config = self.make_config(tmp_path, low_water=0)
+        journal(config["index_file"], ["add", "/a/1.jpg", "alpha", RAW, 100])
+
+        def fail(*args):
+            raise AssertionError("journal replayed")
+
+        monkeypatch.setattr(SpaceIndex, "load", classmethod(fail))
+        assert enforce(config) == ([], [])
+
+    def test_bloated_journal_is_compacted(self, tmp_path):
+        """Test that add/remove churn is compacted even with room to spare"""
+        config = self.make_config(tmp_path, low_water=0)
+        for n in range(2000):
+            journal(config["index_file"], ["add", f"/a/{n}.jpg", "alpha", RAW, 100],
+                    ["remove", f"/a/{n}.jpg"])
+        journal(config["index_file"], ["add", "/a/keep.jpg", "alpha", RAW, 100])
+        enforce(config)
+        assert len(Path(config["index_file"]).read_text().splitlines()) == 1
+        assert SpaceIndex.load(config["index_file"]).used() == 100
+
+    def test_ingest_is_quiet_when_idle(self, tmp_path, monkeypatch, capsys):
+        """Test that a cron ingest with nothing to do prints nothing"""
+        config = self.make_config(tmp_path, low_water=0)
+        monkeypatch.setattr("retain.load_config", lambda: config)
+        monkeypatch.setattr(sys, "argv", ["retain.py", "ingest"])
+        main()
+        assert capsys.readouterr().out == ""
+
+        (tmp_path / "xferlog").write_text(
+            XFERLOG_LINE.format(size=100, name="/s/1.jpg", status="c"))
+        main()
+        assert capsys.readouterr().out == "Received 1 files\n"
+
+
+class TestRetentionConfig:
+    """Test retention configuration"""
+
+    def test_parse_size(self):
+        """Test pits.conf size strings"""
+        assert parse_size("512M") == 512 * 1024**2
+        assert parse_size("1G") == 1024**3
+        assert parse_size("2048") == 2048
+        with pytest.raises(ValueError):
+            parse_size("lots")
+
+    def test_load_config_from_pits_conf(self):
+        """Test that the retention section is read from pits.conf"""
+        config = load_config(Path(__file__).parent.parent / "etc" / "pits.conf")
+        assert config["instance_dir"] == "/var/pits"
+        assert config["low_water"] < config["high_water"]
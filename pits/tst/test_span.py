@@ -0,0 +1,134 @@
+#!/usr/bin/env python3
+"""
+Tracing Tests for PITS Project
+Tests span recording and Chrome trace export
+"""
+
+import pytest
+import os
+import sys
+import json
+import subprocess
+from pathlib import Path
+from types import SimpleNamespace
+
+# Add src directory to path for imports
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
+
+from span import Tracer, NULL_SPAN, tracer  # noqa: E402
+from retain import SpaceIndex, RetentionEngine, RAW  # noqa: E402
+
+
+class TestTracer:
+    """Test the tracer itself"""
+
+    def test_disabled_tracer_records_nothing(self):
+        """Test that a disabled tracer hands out the shared no-op span"""
+        trace = Tracer()
+        with trace.span("stage") as sp:
+            sp.add_bytes(10)
+        assert trace.span("stage") is NULL_SPAN
+        assert trace.events == []
+
+    def test_span_records_metrics(self, tmp_path):
+        """Test that a span records wall, cpu, bytes and rss"""
+        trace = Tracer(str(tmp_path / "trace.json"))
+        with trace.span("ingest", cat="pits", project="alpha") as sp:
+            sum(range(10000))
+            sp.add_bytes(4096)
+        event, = trace.events
+        assert event["name"] == "ingest"
+        assert event["ph"] == "X"
+        assert event["dur"] >= 0
+        assert event["args"]["bytes"] == 4096
+        assert event["args"]["project"] == "alpha"
+        assert event["args"]["rss_start_kb"] > 0
+        assert event["args"]["rss_end_kb"] > 0
+        assert event["args"]["process_peak_rss_kb"] > 0
+        assert "cpu_ms" in event["args"]
+
+    def test_span_marks_errors(self):
+        """Test that an exception is recorded and still raised"""
+        trace = Tracer("unused.json")
+        with pytest.raises(KeyError):
+            with trace.span("stage"):
+                raise KeyError("missing")
+        assert trace.events[0]["args"]["error"] == "KeyError"
+
+    def test_traced_decorator(self):
+        """Test that the decorator only records while enabled"""
+        trace = Tracer()
+
+        @trace.traced()
+        def preview(n):
+            return n * 2
+
+        assert preview(2) == 4
+        assert trace.events == []
+        trace.enable()
+        assert preview(3) == 6
+        assert trace.events[0]["name"].endswith("preview")
+
+    def test_export_appends_to_existing_trace(self, tmp_path):
+        """Test that separate processes can add to one trace file"""
+        path = tmp_path / "trace.json"
+        for stage in ("receive", "hash"):
+            trace = Tracer(str(path))
+            with trace.span(stage):
+                pass
+            trace.export()
+        data = json.loads(path.read_text())
+        assert [event["name"] for event in data["traceEvents"]] == ["receive", "hash"]
+
+    def test_run_traces_a_command(self, tmp_path):
+        """Test that a shell stage is traced with its exit code"""
+        trace = Tracer(str(tmp_path / "trace.json"))
+        assert trace.run("ingest", [sys.executable, "-c", "raise SystemExit(3)"]) == 3
+        assert trace.events[0]["args"]["returncode"] == 3
+
+    def test_run_reports_peak_rss_of_that_command(self, tmp_path):
+        """Test that a command's peak RSS is its own, not every child so far"""
+        trace = Tracer(str(tmp_path / "trace.json"))
+        trace.run("big", [sys.executable, "-c", "b = bytearray(64 * 1024 * 1024)"])
+        trace.run("small", [sys.executable, "-c", "pass"])
+        big, small = (event["args"]["peak_rss_kb"] for event in trace.events)
+        assert big - small > 32 * 1024
+
+    def test_concurrent_exports_keep_every_event(self, tmp_path):
+        """Test that processes exporting at the same time do not lose events"""
+        path = tmp_path / "trace.json"
+        src_dir = Path(__file__).parent.parent / "src"
+        code = (
+            f"import sys; sys.path.insert(0, {str(src_dir)!r})\n"
+            "from span import Tracer\n"
+            f"trace = Tracer({str(path)!r})\n"
+            "for n in range(20):\n"
+            "    with trace.span('stage'):\n"
+            "        pass\n"
+            "    trace.export()\n"
+        )
+        procs = [subprocess.Popen([sys.executable, "-c", code]) for _ in range(4)]
+        assert [proc.wait() for proc in procs] == [0] * 4
+        assert len(json.loads(path.read_text())["traceEvents"]) == 80
+
+
+class TestPipelineTracing:
+    """Test tracing hooks in the PITS pipeline modules"""
+
+    def test_retention_enforce_is_traced(self):
+        """Test that eviction records a span with the bytes freed"""
+        index = SpaceIndex()
+        index.add("/a/1.jpg", "alpha", RAW, 100)
+        index.mark_synced("/a/1.jpg")
+        engine = RetentionEngine(index, "/var/pits", 100, 300,
+                                 disk_usage=lambda root: SimpleNamespace(free=0),
+                                 unlink=lambda path: None)
+        tracer.enable()
+        try:
+            engine.enforce()
+        finally:
+            tracer.disable()
+        event = tracer.events.pop()
+        assert event["name"] == "retain.enforce"
+        assert event["args"]["bytes"] == 100
+        assert event["args"]["evicted"] == 1
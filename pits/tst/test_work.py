@@ -0,0 +1,247 @@
+#!/usr/bin/env python3
+"""
+Scheduler Tests for PITS Project
+Tests the thermal and load aware background work scheduler
+"""
+
+import pytest
+import os
+import sys
+import time
+import threading
+import tempfile
+from pathlib import Path
+
+# Add src directory to path for imports
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
+
+from work import (  # noqa: E402
+    SystemProbe, Scheduler, WorkServer, pressure_level, plan_limits, load_config,
+    niced, run_stage, INGEST, PREVIEW, HASH, UPLOAD, DEFAULT_CLASSES,
+)
+
+PSI_TEMPLATE = (
+    "some avg10={some:.2f} avg60=0.00 avg300=0.00 total=0\n"
+    "full avg10=0.00 avg60=0.00 avg300=0.00 total=0\n"
+)
+
+
+def make_sysfs(root, temp=45.0, load=0.1, cpu=0.0, io=0.0, memory=0.0):
+    """Write a fake procfs/sysfs tree under root"""
+    (root / "proc" / "pressure").mkdir(parents=True, exist_ok=True)
+    zone = root / "sys" / "class" / "thermal" / "thermal_zone0"
+    zone.mkdir(parents=True, exist_ok=True)
+    ncpu = os.cpu_count() or 1
+    (root / "proc" / "loadavg").write_text(f"{load * ncpu:.2f} 0.50 0.40 1/200 1234\n")
+    for name, value in (("cpu", cpu), ("io", io), ("memory", memory)):
+        (root / "proc" / "pressure" / name).write_text(PSI_TEMPLATE.format(some=value))
+    (zone / "temp").write_text(f"{int(temp * 1000)}\n")
+    return SystemProbe(root)
+
+
+class TestSystemProbe:
+    """Test reading pressure from a fake sysfs root"""
+
+    def test_reads_all_sources(self, tmp_path):
+        """Test that every reading is parsed"""
+        probe = make_sysfs(tmp_path, temp=71.5, load=0.5, cpu=12.5, io=3.0, memory=1.0)
+        readings = probe.read()
+        assert readings["temp"] == pytest.approx(71.5)
+        assert readings["load"] == pytest.approx(0.5, abs=0.01)
+        assert readings["cpu"] == pytest.approx(12.5)
+        assert readings["io"] == pytest.approx(3.0)
+        assert readings["memory"] == pytest.approx(1.0)
+
+    def test_missing_files_are_none(self, tmp_path):
+        """Test that a kernel without PSI or thermal zones still works"""
+        readings = SystemProbe(tmp_path).read()
+        assert set(readings.values()) == {None}
+
+    def test_garbled_files_are_none(self, tmp_path):
+        """Test that unparsable readings are ignored rather than raised"""
+        probe = make_sysfs(tmp_path)
+        (tmp_path / "proc" / "loadavg").write_text("")
+        (tmp_path / "proc" / "pressure" / "cpu").write_text("some avg60=1.00 total=0\n")
+        (tmp_path / "proc" / "pressure" / "io").write_text("some avg10=n/a\n")
+        (tmp_path / "sys" / "class" / "thermal" / "thermal_zone0" / "temp").write_text("hot\n")
+        readings = probe.read()
+        assert readings["load"] is None
+        assert readings["cpu"] is None
+        assert readings["io"] is None
+        assert readings["temp"] is None
+        assert readings["memory"] == 0.0
+
+
+class TestPlanning:
+    """Test pressure level and limit planning"""
+
+    def test_idle_system_has_no_pressure(self):
+        """Test that low readings give level zero"""
+        assert pressure_level({"temp": 40.0, "load": 0.2, "cpu": None}) == 0.0
+
+    def test_worst_reading_wins(self):
+        """Test that the highest normalized reading sets the level"""
+        assert pressure_level({"temp": 72.5, "load": 0.2}) == pytest.approx(0.5)
+        assert pressure_level({"temp": 90.0, "load": 0.2}) == 1.0
+
+    def test_full_limits_when_idle(self):
+        """Test that every class gets its maximum with no pressure"""
+        assert plan_limits(0.0) == DEFAULT_CLASSES
+
+    def test_ingest_never_throttled(self):
+        """Test that ingest keeps its workers at full pressure"""
+        limits = plan_limits(1.0)
+        assert limits[INGEST] == DEFAULT_CLASSES[INGEST]
+        assert limits[PREVIEW] == limits[HASH] == limits[UPLOAD] == 0
+
+    def test_partial_pressure_keeps_every_class_alive(self):
+        """Test that each background class gets a worker before any gets two"""
+        limits = plan_limits(0.5)
+        assert limits == {INGEST: 1, PREVIEW: 1, HASH: 1, UPLOAD: 0}
+        assert plan_limits(0.25) == {INGEST: 1, PREVIEW: 1, HASH: 1, UPLOAD: 1}
+
+
+class TestScheduler:
+    """Test the adaptive worker pool"""
+
+    def test_runs_jobs_and_counts_metrics(self, tmp_path):
+        """Test that submitted jobs run and are counted"""
+        scheduler = Scheduler(make_sysfs(tmp_path), interval=60)
+        scheduler.start()
+        try:
+            futures = [scheduler.submit(HASH, pow, n, 2) for n in range(5)]
+            assert [f.result(timeout=5) for f in futures] == [0, 1, 4, 9, 16]
+        finally:
+            scheduler.stop()
+        metrics = scheduler.metrics()
+        assert metrics["completed"][HASH] == 5
+        assert metrics["decisions"] >= 1
+        assert "pits_sched_limits{class=\"ingest\"} 1" in scheduler.render_metrics()
+
+    def test_job_errors_are_reported(self, tmp_path):
+        """Test that a failing job raises through its future"""
+        scheduler = Scheduler(make_sysfs(tmp_path), interval=60)
+        scheduler.start()
+        try:
+            future = scheduler.submit(UPLOAD, int, "not a number")
+            with pytest.raises(ValueError):
+                future.result(timeout=5)
+        finally:
+            scheduler.stop()
+        assert scheduler.metrics()["failed"][UPLOAD] == 1
+
+    def test_ingest_runs_while_background_is_held(self, tmp_path):
+        """Test that ingest jobs still run when heat holds background work back"""
+        scheduler = Scheduler(make_sysfs(tmp_path, temp=85.0), interval=60)
+        scheduler.start()
+        try:
+            preview = scheduler.submit(PREVIEW, lambda: "preview")
+            assert scheduler.submit(INGEST, lambda: "ingest").result(timeout=5) == "ingest"
+            assert not preview.done()
+            assert scheduler.metrics()["queued"][PREVIEW] == 1
+
+            make_sysfs(tmp_path, temp=45.0)
+            scheduler.adapt()
+            assert preview.result(timeout=5) == "preview"
+        finally:
+            scheduler.stop()
+
+    def test_limits_cap_concurrency(self, tmp_path):
+        """Test that a class never runs more jobs than its limit"""
+        scheduler = Scheduler(make_sysfs(tmp_path), interval=60)
+        release = threading.Event()
+        scheduler.start()
+        try:
+            futures = [scheduler.submit(UPLOAD, release.wait, 5) for _ in range(3)]
+            assert not futures[1].done()
+            assert scheduler.metrics()["running"][UPLOAD] <= DEFAULT_CLASSES[UPLOAD]
+            release.set()
+            for future in futures:
+                future.result(timeout=5)
+        finally:
+            scheduler.stop()
+
+    def test_ingest_starts_promptly_with_control_loop_running(self, tmp_path):
+        """Test that job wakeups are not swallowed by the control loop"""
+        scheduler = Scheduler(make_sysfs(tmp_path), interval=30)
+        scheduler.start()
+        try:
+            for _ in range(40):
+                submitted = time.monotonic()
+                started = scheduler.submit(INGEST, time.monotonic).result(timeout=5)
+                assert started - submitted < 0.5
+        finally:
+            scheduler.stop()
+
+    def test_equal_soft_and_hard_rejected(self, tmp_path):
+        """Test that a zero width threshold band is refused"""
+        with pytest.raises(ValueError):
+            Scheduler(SystemProbe(tmp_path), thresholds={"temp": (70.0, 70.0)})
+        config_file = tmp_path / "pits.conf"
+        config_file.write_text("[scheduler]\ntemp_soft = 70\ntemp_hard = 70\n")
+        with pytest.raises(ValueError):
+            load_config(config_file)
+
+    def test_unknown_class_rejected(self):
+        """Test that an unknown job class is refused"""
+        with pytest.raises(ValueError):
+            Scheduler(SystemProbe("/nonexistent")).submit("thumbnail", print)
+
+
+def make_work_config(tmp_path, socket_dir):
+    """Return a work.py config pointing at a fake sysfs and a private socket"""
+    config_file = tmp_path / "pits.conf"
+    config_file.write_text("[scheduler]\n")
+    config = load_config(config_file)
+    config["sysfs_root"] = str(tmp_path)
+    config["socket"] = str(Path(socket_dir) / "work.sock")
+    config["metrics_file"] = str(tmp_path / "work.prom")
+    return config
+
+
+class TestWorkServer:
+    """Test running shell stages through the scheduler daemon"""
+
+    @pytest.fixture
+    def socket_dir(self):
+        # Unix socket paths are limited to about 100 bytes, tmp_path can be longer
+        with tempfile.TemporaryDirectory() as path:
+            yield path
+
+    def test_background_classes_are_niced(self):
+        """Test that only background stages get a lower priority"""
+        assert niced(["true"], 0) == ["true"]
+        assert niced(["true"], 15)[:3] == ["nice", "-n", "15"]
+        assert niced(["true"], 15)[-1] == "true"
+
+    def test_run_goes_through_the_daemon(self, tmp_path, socket_dir):
+        """Test that a stage takes a slot and is counted by the daemon"""
+        config = make_work_config(tmp_path, socket_dir)
+        make_sysfs(tmp_path)
+        scheduler = Scheduler(SystemProbe(tmp_path), config["classes"], config["thresholds"],
+                              60, config["metrics_file"])
+        scheduler.start()
+        server = WorkServer(config["socket"], scheduler)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        try:
+            assert run_stage(config, HASH, [sys.executable, "-c", "pass"]) == 0
+            assert run_stage(config, UPLOAD, [sys.executable, "-c", "raise SystemExit(2)"]) == 2
+            deadline = time.monotonic() + 5
+            while scheduler.metrics()["failed"][UPLOAD] == 0 and time.monotonic() < deadline:
+                time.sleep(0.01)
+        finally:
+            server.shutdown()
+            server.server_close()
+            scheduler.stop()
+        metrics = scheduler.metrics()
+        assert metrics["completed"][HASH] == 1
+        assert metrics["failed"][UPLOAD] == 1
+        scheduler.write_metrics()
+        assert 'pits_sched_completed_total{class="hash"} 1' in Path(config["metrics_file"]).read_text()
+
+    def test_run_without_daemon_still_runs(self, tmp_path, socket_dir):
+        """Test that a stage runs directly when the daemon is not up"""
+        config = make_work_config(tmp_path, socket_dir)
+        assert run_stage(config, PREVIEW, [sys.executable, "-c", "raise SystemExit(4)"]) == 4
+        with pytest.raises(ValueError):
+            run_stage(config, "thumbnail", ["true"])
@@ -10,6 +10,13 @@ import shutil
 from pathlib import Path
 from datetime import datetime
 
+# span.py is shared with PITS; builds carry a copy next to this file
+SPAN_SOURCE = Path(__file__).resolve().parent.parent.parent / "pits" / "src" / "span.py"
+if not (Path(__file__).parent / "span.py").exists():
+    sys.path.append(str(SPAN_SOURCE.parent))
+
+from span import span, traced  # noqa: E402
+
 
 class SiteProject:
     """Main Site project class."""
@@ -60,6 +67,11 @@ class SiteProject:
             print("📦 Build Status: Not built")
             print("   Run './bin/site build' to create build artifacts")
 
+    def _tree_bytes(self, path):
+        """Return the total size of files under a directory."""
+        return sum(item.stat().st_size for item in Path(path).rglob("*") if item.is_file())
+
+    @traced("site.create_build", cat="site")
     def create_build(self):
         """Create build artifacts."""
         print("🔨 Creating build...")
@@ -70,13 +82,21 @@ class SiteProject:
         # Copy source files
         src_dir = self.root_dir / "src"
         if src_dir.exists():
-            shutil.copytree(src_dir, build_dir / "src", dirs_exist_ok=True)
+            with span("site.copy_src", cat="site") as sp:
+                shutil.copytree(src_dir, build_dir / "src", dirs_exist_ok=True)
+                if SPAN_SOURCE.exists():
+                    shutil.copy2(SPAN_SOURCE, build_dir / "src" / "span.py")
+                if sp.active:
+                    sp.add_bytes(self._tree_bytes(src_dir))
             print("   ✅ Source files copied")
 
         # Copy web files
         www_dir = self.root_dir / "www"
         if www_dir.exists():
-            shutil.copytree(www_dir, build_dir / "www", dirs_exist_ok=True)
+            with span("site.copy_www", cat="site") as sp:
+                shutil.copytree(www_dir, build_dir / "www", dirs_exist_ok=True)
+                if sp.active:
+                    sp.add_bytes(self._tree_bytes(www_dir))
             print("   ✅ Web files copied")
 
         # Create build info
@@ -93,6 +113,7 @@ class SiteProject:
         print("   ✅ Build info created")
         print(f"✅ Build completed: {build_dir}")
 
+    @traced("site.create_deployment_package", cat="site")
     def create_deployment_package(self):
         """Create deployment package."""
         print("🚀 Creating deployment package...")
@@ -110,7 +131,10 @@ class SiteProject:
         package_path = deploy_dir / package_name
 
         # Create tar.gz package
-        shutil.make_archive(str(package_path).replace(".tar.gz", ""), "gztar", build_dir)
+        with span("site.make_archive", cat="site") as sp:
+            shutil.make_archive(str(package_path).replace(".tar.gz", ""), "gztar", build_dir)
+            if sp.active:
+                sp.add_bytes(package_path.stat().st_size)
 
         print(f"✅ Deployment package created: {package_path}")
         print(f"📦 Package size: {package_path.stat().st_size / 1024:.1f} KB")
@@ -0,0 +1,57 @@
+#!/usr/bin/env python3
+"""
+Tracing Tests for Site Project
+Tests that builds and deployments record trace spans
+"""
+
+import pytest
+import os
+import sys
+import shutil
+from pathlib import Path
+
+# Add src directory to path for imports
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
+
+import main  # noqa: E402
+from span import tracer  # noqa: E402
+
+
+@pytest.fixture
+def project(tmp_path):
+    """Site project rooted in a scratch copy of src and www"""
+    site_dir = Path(__file__).parent.parent
+    shutil.copytree(site_dir / "src", tmp_path / "src")
+    shutil.copytree(site_dir / "www", tmp_path / "www")
+    site = main.SiteProject()
+    site.root_dir = tmp_path
+    tracer.enable()
+    tracer.events.clear()
+    yield site
+    tracer.disable()
+    tracer.events.clear()
+
+
+class TestSiteTracing:
+    """Test spans around build and deploy"""
+
+    def test_build_records_spans(self, project):
+        """Test that a build records the build and copy spans"""
+        project.create_build()
+        names = [event["name"] for event in tracer.events]
+        assert names == ["site.copy_src", "site.copy_www", "site.create_build"]
+        assert tracer.events[1]["args"]["bytes"] > 0
+
+    def test_build_carries_the_shared_span_module(self, project):
+        """Test that the build gets a copy of pits/src/span.py"""
+        project.create_build()
+        built = project.root_dir / "var" / "build" / "src" / "span.py"
+        assert built.read_bytes() == main.SPAN_SOURCE.read_bytes()
+
+    def test_deploy_records_package_bytes(self, project):
+        """Test that packaging records the archive size"""
+        project.create_build()
+        project.create_deployment_package()
+        archive = next(e for e in tracer.events if e["name"] == "site.make_archive")
+        package = next((project.root_dir / "var" / "deploy").glob("*.tar.gz"))
+        assert archive["args"]["bytes"] == package.stat().st_size